@@ -20,6 +20,10 @@ import os
 import sys
 import re
 import json
+import hashlib
+import random
+import time
+from collections import Counter, defaultdict
 from enum import Enum
 # pydicom is MIT licenced
 try:
@@ -30,7 +34,7 @@ import pydicom._dicom_dict as dicom_dict  # TODO: Is this a good idea? Should I
 # PyQt is GPL v3 licenced
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QPushButton, QCompleter, QLineEdit, QHBoxLayout, \
-    QLabel, QAbstractItemView, QListWidgetItem, QComboBox
+    QLabel, QAbstractItemView, QListWidgetItem, QComboBox, QInputDialog
 from PyQt5.QtCore import QSettings, Qt, QThread, QStringListModel, QObject, pyqtSignal, QUrl
 from PyQt5.QtGui import QDesktopServices
 # Files from this project
@@ -53,6 +57,15 @@ class FileOptions(Enum):
     FILE_NAME = 'File Name'
     FILE_PATH = 'File Path'
 
+class DuplicateOptions(Enum):
+    PROCESS_ALL = 'Process all'
+    SKIP = 'Skip'
+    REFERENCE_FIRST = 'Reference first occurrence'
+
+class SampleOptions(Enum):
+    PER_DIRECTORY = 'Per directory'
+    PER_SERIES = 'Per series'
+
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
@@ -128,14 +141,41 @@ class MainWindow(QtWidgets.QMainWindow):
         self.count_file_number.connect(self.count_num_of_files_thread.count)
         self.count_file_number.emit(self.ui.labelFolderToAnalysePath.text())  # Using a signal to keep thread safety
 
+        # Restore how duplicate instances were handled last time
+        self.ui.comboBoxDuplicateHandling.addItems([option.value for option in DuplicateOptions])
+        duplicate_index = self.ui.comboBoxDuplicateHandling.findText(
+            self.settings.value('main/duplicateHandling', DuplicateOptions.PROCESS_ALL.value))
+        if duplicate_index >= 0:
+            self.ui.comboBoxDuplicateHandling.setCurrentIndex(duplicate_index)
+        self.ui.checkBoxHashDuplicates.setChecked(self.settings.value('main/hashDuplicates', False, type=bool))
+        self.ui.comboBoxDuplicateHandling.currentIndexChanged[str].connect(
+            lambda text: self.settings.setValue('main/duplicateHandling', text))
+        self.ui.checkBoxHashDuplicates.toggled.connect(
+            lambda checked: self.settings.setValue('main/hashDuplicates', checked))
+
+        self.number_of_files = 0
+        self.analysis_start_time = None
+        self.busy = False
         self.ui.progressBar.setFormat(' %v/%m (%p%)')
         self.ui.progressBar.hide()
 
         self.ui.actionSave_Template.triggered.connect(self.save_template)
         self.ui.actionLoad_Template.triggered.connect(self.load_template)
         self.ui.actionAbout.triggered.connect(self.open_about_window)
+        self.ui.actionEstimate_Run.triggered.connect(self.estimate_run)
 
         self.analyse_and_output_data_thread = AnalyseAndOutputDataThread()
+        self.analyse_and_output_data_thread.current_file.connect(self.update_analysis_progress)
+        self.analyse_and_output_data_thread.finished.connect(self.csv_making_finished)
+        self.analyse_and_output_data_thread.error.connect(self.worker_failed)
+        self.create_csv.connect(self.analyse_and_output_data_thread.run)
+
+        self.sample_files_thread = SampleFilesThread()
+        self.sample_files_thread.num_of_files.connect(self.ui.progressBar.setMaximum)
+        self.sample_files_thread.current_file.connect(self.ui.progressBar.setValue)
+        self.sample_files_thread.finished.connect(self.sampling_finished)
+        self.sample_files_thread.error.connect(self.worker_failed)
+        self.sample_files.connect(self.sample_files_thread.run)
 
         self.show()
 
@@ -225,8 +265,11 @@ class MainWindow(QtWidgets.QMainWindow):
         msg_box.exec()
 
     def update_number_of_files(self, num):
+        self.number_of_files = num
         self.ui.labelNumberOfFiles.setText(str(num) + ' files')
-        self.ui.progressBar.setMaximum(num)
+        # While a job is running it looks after the progress bar itself
+        if not self.busy:
+            self.ui.progressBar.setMaximum(num)
 
     # The checked variable is emitted from the signal, but we don't use it here
     def add_new_list_widget(self, checked=False, default_text='', attribute_type=AttributeOptions.DICOM_TAG, combo_box_text=None):
@@ -305,6 +348,21 @@ class MainWindow(QtWidgets.QMainWindow):
             msg_box.exec()
             if msg_box.clickedButton() != overwrite_button:
                 return
+        selected_attributes = self.get_selected_attributes()
+        if selected_attributes is None:
+            return
+        csv_header, _, dicom_tags, file_attributes, selected_plugins = selected_attributes
+
+        self.set_busy(True)
+        self.ui.progressBar.setMaximum(self.number_of_files)
+        self.ui.progressBar.show()
+        self.analysis_start_time = time.perf_counter()
+        self.create_csv.emit(self.ui.labelOutputFile.text(), self.ui.labelFolderToAnalysePath.text(), csv_header, dicom_tags,file_attributes,selected_plugins,
+                             self.ui.comboBoxDuplicateHandling.currentText(), self.ui.checkBoxHashDuplicates.isChecked())
+
+    # Returns the csv header, the DICOM tag names and the lists of selected DICOM tags, file attributes and plugins,
+    # or None (after showing an error) if one of the attributes isn't valid
+    def get_selected_attributes(self):
         header_DICOM = ''
         header_file_info = ''
         header_custom_plugins = ''
@@ -337,7 +395,7 @@ class MainWindow(QtWidgets.QMainWindow):
                     msg_box.setText('"' + text + '" is not a valid attribute')
                     msg_box.setIcon(QMessageBox.Critical)
                     msg_box.exec()
-                    return
+                    return None
                 header_DICOM += text.replace(',', ' ') + ','
             elif custom_widget.comboBoxAttributeChoice.currentText() == AttributeOptions.CUSTOM_PLUGIN.value:
                 plugin_name = custom_widget.comboBoxPluginOption.currentText()
@@ -347,18 +405,86 @@ class MainWindow(QtWidgets.QMainWindow):
             else:
                 raise NotImplementedError
 
-        csv_header = (header_file_info + header_DICOM + header_custom_plugins)[0:-1]  # Remove the last comma
+        header_duplicates = ''
+        if self.ui.comboBoxDuplicateHandling.currentText() == DuplicateOptions.REFERENCE_FIRST.value:
+            header_duplicates = 'Duplicate of,'
+
+        csv_header = (header_file_info + header_DICOM + header_custom_plugins + header_duplicates)[0:-1]  # Remove the last comma
+        dicom_tag_names = header_DICOM.split(',')[0:-1]
+        return csv_header, dicom_tag_names, dicom_tags, file_attributes, selected_plugins
+
+    # Only one worker can drive the progress bar at a time, so stop new runs / estimates while one is going
+    def set_busy(self, busy):
+        self.busy = busy
+        self.ui.pushButtonDoAnalysis.setEnabled(not busy)
+        self.ui.actionEstimate_Run.setEnabled(not busy)
+
+    def update_analysis_progress(self, num):
+        # The files may still be being counted, so keep the maximum up to date
+        self.ui.progressBar.setMaximum(max(self.number_of_files, num))
+        self.ui.progressBar.setValue(num)
+        if num > 0 and self.analysis_start_time is not None:
+            elapsed = time.perf_counter() - self.analysis_start_time
+            remaining = max(0, elapsed / num * (self.ui.progressBar.maximum() - num))
+            self.ui.progressBar.setFormat(' %v/%m (%p%) - ' + str(round(num / elapsed, 1)) + ' files/s, ' +
+                                          format_duration(remaining) + ' remaining')
+
+    def csv_making_finished(self):
+        self.analysis_start_time = None
+        self.ui.progressBar.setFormat(' %v/%m (%p%)')
+        self.ui.progressBar.hide()
+        self.set_busy(False)
+
+    def worker_failed(self, message):
+        self.analysis_start_time = None
+        self.ui.progressBar.setFormat(' %v/%m (%p%)')
+        self.ui.progressBar.hide()
+        self.ui.progressBar.setMaximum(self.number_of_files)
+        self.set_busy(False)
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle("Error")
+        msg_box.setText('Stopped early because of an error: ' + message)
+        msg_box.setIcon(QMessageBox.Critical)
+        msg_box.exec()
 
+    def estimate_run(self):
+        selected_attributes = self.get_selected_attributes()
+        if selected_attributes is None:
+            return
+        csv_header, dicom_tag_names, dicom_tags, file_attributes, selected_plugins = selected_attributes
+
+        sample_size, ok = QInputDialog.getInt(self, 'Estimate run', 'Number of files to sample',
+                                              self.settings.value('main/sampleSize', 200, type=int), 1, 1000000)
+        if not ok:
+            return
+        strata, ok = QInputDialog.getItem(self, 'Estimate run', 'Spread the sample evenly',
+                                          [option.value for option in SampleOptions], 0, False)
+        if not ok:
+            return
+        self.settings.setValue('main/sampleSize', sample_size)
+
+        self.set_busy(True)
+        self.ui.progressBar.setValue(0)
         self.ui.progressBar.show()
-        self.analyse_and_output_data_thread.current_file.connect(lambda num: self.ui.progressBar.setValue(num))
-        self.create_csv.connect(self.analyse_and_output_data_thread.run)
-        self.analyse_and_output_data_thread.finished.connect(self.csv_making_finished)
-        self.create_csv.emit(self.ui.labelOutputFile.text(), self.ui.labelFolderToAnalysePath.text(), csv_header, dicom_tags,file_attributes,selected_plugins)
+        # The DICOM tag names are only used to label the value distributions in the report
+        self.sample_files.emit(self.ui.labelFolderToAnalysePath.text(), sample_size, strata, csv_header,
+                               dicom_tags, dicom_tag_names, file_attributes, selected_plugins,
+                               self.ui.comboBoxDuplicateHandling.currentText(),
+                               self.ui.checkBoxHashDuplicates.isChecked())
 
-    def csv_making_finished(self):
+    def sampling_finished(self, summary, details):
         self.ui.progressBar.hide()
+        self.ui.progressBar.setMaximum(self.number_of_files)
+        self.set_busy(False)
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle("Estimate run")
+        msg_box.setText(summary)
+        msg_box.setDetailedText(details)
+        msg_box.setIcon(QMessageBox.Information)
+        msg_box.exec()
 
-    create_csv = pyqtSignal(str, str, str, list,list,list)
+    create_csv = pyqtSignal(str, str, str, list,list,list,str,bool)
+    sample_files = pyqtSignal(str, int, str, str, list, list, list, list, str, bool)
     count_file_number = pyqtSignal(str)
 
 
@@ -372,64 +498,42 @@ class AnalyseAndOutputDataThread(QObject):
         self.moveToThread(self.worker_thread)
         self.worker_thread.start()
 
-    def run(self, output_file, folder_to_analyse, header, dicom_tags, file_attributes,custom_plugins):
+    def run(self, output_file, folder_to_analyse, header, dicom_tags, file_attributes,custom_plugins,
+            duplicate_handling=DuplicateOptions.PROCESS_ALL.value, hash_duplicates=False):
+        # Anything going wrong here (e.g. the output file is open elsewhere, or a plugin fails on a file) needs
+        # reporting back, otherwise the main window never hears the run has ended
+        try:
+            self.write_csv(output_file, folder_to_analyse, header, dicom_tags, file_attributes, custom_plugins,
+                           duplicate_handling, hash_duplicates)
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit()
+
+    def write_csv(self, output_file, folder_to_analyse, header, dicom_tags, file_attributes, custom_plugins,
+                  duplicate_handling, hash_duplicates):
         with open(output_file, 'w') as f:
             f.write(header + '\n')
-            system_location = os.path.dirname(os.path.realpath(__file__))
-            plugin_locations = [os.path.join(system_location, 'Plugins')]
             # We make a new plugin manager here to insure they are running on the new thread
-            plugin_manager = PluginManager()
-            plugin_manager.setPluginPlaces(plugin_locations)
-            plugin_manager.collectPlugins()
+            plugin_manager = create_plugin_manager()
+            num_data_columns = get_num_data_columns(dicom_tags, custom_plugins, plugin_manager)
+            duplicate_index = None
+            if duplicate_handling != DuplicateOptions.PROCESS_ALL.value:
+                duplicate_index = DuplicateIndex(hash_duplicates)
             count = 0
             for dirpath, _, filenames in os.walk(folder_to_analyse):
                 for filename in filenames:
-                    output_line = ''
-                    full_path = os.path.join(dirpath, filename)
-                    try:
-                        ds = pydicom.read_file(full_path)
-                    #  If it isn't a valid DICOM file or we can't load the file, we'll just skip over it
-                    except (pydicom.errors.InvalidDicomError,FileNotFoundError, OSError, PermissionError):
-                        count += 1
-                        self.current_file.emit(count)
-                        continue #
-                    except OSError as e:
-                        if e.args[0] != 6:  # No such device or address
-                            raise
-                        else:
-                            count += 1
-                            self.current_file.emit(count)
-                            continue
-                    # List the file attributes
-                    for attribute in file_attributes:
-                        try:
-                            if attribute == FileOptions.FILE_NAME.value:
-                                output_line += filename + ','
-                            elif attribute == FileOptions.FILE_PATH.value:
-                                output_line += full_path + ','
-                            elif attribute == FileOptions.FILE_SIZE.value:
-                                output_line += str(round(os.path.getsize(full_path)/(1000*1000),3)) + ','
-                            else:
-                                raise NotImplementedError
-                        except (FileNotFoundError, OSError, PermissionError):
-                            pass
-
-                    for tag in dicom_tags:
-                        output_line += get_dicom_value_from_tag(ds, tag) + ','
-
-                    for plugin_name in custom_plugins:
-                        plugin = plugin_manager.getPluginByName(plugin_name).plugin_object
-                        output_line += plugin.generate_values(full_path,ds)
-
-                    output_line = output_line[0:-1]  # Remove the last comma
-                    f.write(output_line + '\n')
-
                     count += 1
+                    full_path = os.path.join(dirpath, filename)
+                    output_line, _, _ = process_file(full_path, duplicate_index, duplicate_handling, num_data_columns,
+                                                     dicom_tags, file_attributes, custom_plugins, plugin_manager)
+                    if output_line is not None:
+                        f.write(output_line + '\n')
                     self.current_file.emit(count)
-        self.finished.emit()
 
     current_file = pyqtSignal(int)
     finished = pyqtSignal()
+    error = pyqtSignal(str)
 
 
 # Simple worker thread for counting the number of files recursively in a folder and subfolders
@@ -453,6 +557,131 @@ class CountFilesThread(QObject):
     num_of_files = pyqtSignal(int)
 
 
+# Worker thread that processes a stratified random sample of the files, to estimate what an archive
+# contains and how long / how large a full run with the current attributes would be
+class SampleFilesThread(QObject):
+    def __init__(self):
+        super(SampleFilesThread, self).__init__()
+
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.worker_thread.start()
+
+    def run(self, folder_to_analyse, sample_size, strata_option, header, dicom_tags, dicom_tag_names,
+            file_attributes, custom_plugins, duplicate_handling=DuplicateOptions.PROCESS_ALL.value,
+            hash_duplicates=False):
+        # As with a full run, any error needs reporting back so the main window knows the estimate has ended
+        try:
+            summary, details = self.estimate(folder_to_analyse, sample_size, strata_option, header, dicom_tags,
+                                             dicom_tag_names, file_attributes, custom_plugins, duplicate_handling,
+                                             hash_duplicates)
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        self.finished.emit(summary, details)
+
+    # Returns the summary and details of the report
+    def estimate(self, folder_to_analyse, sample_size, strata_option, header, dicom_tags, dicom_tag_names,
+                 file_attributes, custom_plugins, duplicate_handling, hash_duplicates):
+        # We don't know how many files there are until we've been through them all, so show the progress bar as busy
+        self.num_of_files.emit(0)
+
+        # Group the files into strata, so every directory / series gets its share of the sample
+        strata = defaultdict(list)
+        start_time = time.perf_counter()
+        series_seconds = 0
+        for dirpath, _, filenames in os.walk(folder_to_analyse):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                if strata_option == SampleOptions.PER_SERIES.value:
+                    # Needs a header only read of every file, but that's still much cheaper than a full run
+                    series_start_time = time.perf_counter()
+                    strata[get_series_instance_uid(full_path)].append(full_path)
+                    series_seconds += time.perf_counter() - series_start_time
+                else:
+                    strata[dirpath].append(full_path)
+        # A full run walks the folder too, but doesn't need the series UIDs
+        walk_seconds = time.perf_counter() - start_time - series_seconds
+        total_files = sum(len(files) for files in strata.values())
+        if total_files == 0:
+            return 'No files found in ' + folder_to_analyse, ''
+
+        # If there are more strata than files to sample, we sample one file from a random selection of strata
+        # Each entry is (file path, number of files in the archive that file stands in for)
+        sample = []
+        chosen_strata = list(strata.keys())
+        if len(chosen_strata) > sample_size:
+            chosen_strata = random.sample(chosen_strata, sample_size)
+        strata_scale = len(strata) / len(chosen_strata)
+        strata_sizes = [len(strata[key]) for key in chosen_strata]
+        for key, num_to_sample in zip(chosen_strata, allocate_sample(strata_sizes, sample_size)):
+            files = strata[key]
+            weight = len(files) / num_to_sample * strata_scale
+            sample += [(full_path, weight) for full_path in random.sample(files, num_to_sample)]
+        self.num_of_files.emit(len(sample))
+
+        # We make a new plugin manager here to insure they are running on the new thread
+        plugin_manager = create_plugin_manager()
+        num_data_columns = get_num_data_columns(dicom_tags, custom_plugins, plugin_manager)
+        duplicate_index = None
+        if duplicate_handling != DuplicateOptions.PROCESS_ALL.value:
+            duplicate_index = DuplicateIndex(hash_duplicates)
+        estimated_seconds = 0
+        estimated_bytes = 0
+        dicom_weight = 0
+        unique_weight = 0
+        value_counts = [Counter() for _ in dicom_tags]
+        for count, (full_path, weight) in enumerate(sample, start=1):
+            # Time the same work a full run would do for this file
+            start_time = time.perf_counter()
+            output_line, ds, duplicate_of = process_file(full_path, duplicate_index, duplicate_handling,
+                                                         num_data_columns, dicom_tags, file_attributes,
+                                                         custom_plugins, plugin_manager)
+            estimated_seconds += (time.perf_counter() - start_time) * weight
+            if output_line is not None:
+                estimated_bytes += (len(output_line) + 1) * weight  # Including the newline
+            if ds is not None or duplicate_of is not None:
+                dicom_weight += weight
+            if ds is not None:
+                unique_weight += weight
+                for index, tag in enumerate(dicom_tags):
+                    value_counts[index][get_dicom_value_from_tag(ds, tag)] += weight
+            self.current_file.emit(count)
+
+        total_weight = sum(weight for _, weight in sample)
+        summary = ('Sampled ' + str(len(sample)) + ' of ' + str(total_files) + ' files from ' +
+                   str(len(chosen_strata)) + ' of ' + str(len(strata)) + ' ' +
+                   ('series' if strata_option == SampleOptions.PER_SERIES.value else 'directories') + '\n\n' +
+                   'Estimated DICOM files: ' + str(round(100 * dicom_weight / total_weight, 1)) + '%\n' +
+                   'Estimated run time: ' +
+                   format_duration(walk_seconds + estimated_seconds / total_weight * total_files) + '\n' +
+                   'Estimated output size: ' +
+                   str(round((len(header) + 1 + estimated_bytes / total_weight * total_files) / (1000*1000), 3)) + ' MB')
+        if strata_option == SampleOptions.PER_SERIES.value:
+            summary += '\n\nReading the series of every file for this estimate took ' + format_duration(series_seconds)
+        if duplicate_index is not None:
+            summary += '\n\nDuplicates are only spotted within the sample, so the time and space saved by ' + \
+                       'handling them is underestimated'
+
+        # Approximate value distributions for the selected DICOM tags (over unique instances), most common first
+        details = ''
+        if unique_weight == 0:
+            dicom_tag_names = []
+        for name, counts in zip(dicom_tag_names, value_counts):
+            details += name + ':\n'
+            for value, weight in counts.most_common(10):
+                details += '    ' + (value if value != '' else '(missing)') + ': ' + \
+                           str(round(100 * weight / unique_weight, 1)) + '%\n'
+            if len(counts) > 10:
+                details += '    (' + str(len(counts) - 10) + ' other values)\n'
+        return summary, details
+
+    num_of_files = pyqtSignal(int)
+    current_file = pyqtSignal(int)
+    finished = pyqtSignal(str, str)
+    error = pyqtSignal(str)
+
+
 class CustomListWidget(QtWidgets.QWidget):
     def __init__(self,parent=None,plugin_list=list()):
         super(CustomListWidget, self).__init__(parent=parent)
@@ -500,6 +729,54 @@ class CustomListWidget(QtWidgets.QWidget):
             raise NotImplemented
 
 
+# Keeps track of the instances seen so far, so copies of the same instance can be spotted from a header read.
+# Instances are matched on their SOPInstanceUID. If use_content_hash is set, files sharing a UID also need
+# identical contents (so e.g. re-exports that modified the data aren't treated as duplicates), and files
+# without a UID are matched on their contents alone. Files are only hashed when they could be a duplicate
+class DuplicateIndex:
+    def __init__(self, use_content_hash=False):
+        self.use_content_hash = use_content_hash
+        # Maps each SOPInstanceUID to a dictionary of content hash to file path, for the distinct files seen
+        # with that UID. The first file's hash is None until another file turns up with the same UID
+        self.uid_index = {}
+        # Maps the content hash of files without a SOPInstanceUID to the first file it was found in
+        self.hash_index = {}
+
+    # Returns (first occurrence, key), where first occurrence is the path of an earlier copy of this file
+    # (or None) and key should be passed to add() once the file has been processed successfully.
+    # Raises the same errors as pydicom.read_file if this file can't be read
+    def find_first_occurrence(self, full_path):
+        sop_instance_uid = get_sop_instance_uid(full_path)
+        if sop_instance_uid == '':
+            if not self.use_content_hash:
+                return None, None
+            file_hash = get_file_hash(full_path)
+            return self.hash_index.get(file_hash), (sop_instance_uid, file_hash)
+
+        occurrences = self.uid_index.get(sop_instance_uid, {})
+        if not self.use_content_hash or len(occurrences) == 0:
+            first_occurrence = next(iter(occurrences.values())) if len(occurrences) > 0 else None
+            return first_occurrence, (sop_instance_uid, None)
+
+        file_hash = get_file_hash(full_path)
+        if None in occurrences:
+            earlier_path = occurrences.pop(None)
+            try:
+                occurrences.setdefault(get_file_hash(earlier_path), earlier_path)
+            # If the earlier file has since been moved or can't be read, it can't match anything
+            except (FileNotFoundError, OSError, PermissionError):
+                pass
+        return occurrences.get(file_hash), (sop_instance_uid, file_hash)
+
+    # Records full_path as the first occurrence of its instance
+    def add(self, key, full_path):
+        sop_instance_uid, file_hash = key
+        if sop_instance_uid != '':
+            self.uid_index.setdefault(sop_instance_uid, {}).setdefault(file_hash, full_path)
+        else:
+            self.hash_index[file_hash] = full_path
+
+
 class ClickableQLabel(QLabel):
     def __init__(self, parent=None):
         super(ClickableQLabel, self).__init__(parent)
@@ -518,6 +795,141 @@ def get_dicom_value_from_tag(ds, tag):
         return ''
 
 
+def create_plugin_manager():
+    system_location = os.path.dirname(os.path.realpath(__file__))
+    plugin_locations = [os.path.join(system_location, 'Plugins')]
+    plugin_manager = PluginManager()
+    plugin_manager.setPluginPlaces(plugin_locations)
+    plugin_manager.collectPlugins()
+    return plugin_manager
+
+
+# Duplicate rows only fill in the file attributes and the 'Duplicate of' column, so we need to know
+# how many DICOM / plugin columns to leave blank
+def get_num_data_columns(dicom_tags, custom_plugins, plugin_manager):
+    num_data_columns = len(dicom_tags)
+    for plugin_name in custom_plugins:
+        num_data_columns += plugin_manager.getPluginByName(plugin_name).plugin_object.column_headers().count(',')
+    return num_data_columns
+
+
+# Does everything a run does for a single file. Returns (output line, ds, duplicate of), where output line is
+# the csv row to write (or None if the file is skipped), ds is the dataset if the file had a full read and
+# duplicate of is the path of the first occurrence if the file is a duplicate
+def process_file(full_path, duplicate_index, duplicate_handling, num_data_columns, dicom_tags, file_attributes,
+                 custom_plugins, plugin_manager):
+    key = None
+    if duplicate_index is not None:
+        # Only the header is read here, so duplicates never get the full read or the plugins run on them
+        try:
+            duplicate_of, key = duplicate_index.find_first_occurrence(full_path)
+        except (pydicom.errors.InvalidDicomError, FileNotFoundError, OSError, PermissionError):
+            return None, None, None
+        if duplicate_of is not None:
+            if duplicate_handling != DuplicateOptions.REFERENCE_FIRST.value:
+                return None, None, duplicate_of
+            output_line = get_file_attribute_values(full_path, file_attributes)
+            output_line += ',' * num_data_columns + duplicate_of + ','
+            return output_line[0:-1], None, duplicate_of  # Remove the last comma
+
+    try:
+        ds = pydicom.read_file(full_path)
+    #  If it isn't a valid DICOM file or we can't load the file, we'll just skip over it
+    except (pydicom.errors.InvalidDicomError, FileNotFoundError, OSError, PermissionError):
+        return None, None, None
+    # Only index the file once it's been read, so if it fails the next copy gets processed in its place
+    if key is not None:
+        duplicate_index.add(key, full_path)
+
+    output_line = get_output_values(full_path, ds, dicom_tags, file_attributes, custom_plugins, plugin_manager)
+    if duplicate_handling == DuplicateOptions.REFERENCE_FIRST.value:
+        output_line += ','  # This is the first occurrence, so the 'Duplicate of' column is empty
+    return output_line[0:-1], ds, None  # Remove the last comma
+
+
+# Returns the file attributes, DICOM values and plugin values for a single file as a comma terminated csv row
+def get_output_values(full_path, ds, dicom_tags, file_attributes, custom_plugins, plugin_manager):
+    output_line = get_file_attribute_values(full_path, file_attributes)
+
+    for tag in dicom_tags:
+        output_line += get_dicom_value_from_tag(ds, tag) + ','
+
+    for plugin_name in custom_plugins:
+        plugin = plugin_manager.getPluginByName(plugin_name).plugin_object
+        output_line += plugin.generate_values(full_path, ds)
+    return output_line
+
+
+# Returns the requested file attributes (name, path, size) as a comma terminated string of csv values
+def get_file_attribute_values(full_path, file_attributes):
+    output_line = ''
+    for attribute in file_attributes:
+        try:
+            if attribute == FileOptions.FILE_NAME.value:
+                output_line += os.path.basename(full_path) + ','
+            elif attribute == FileOptions.FILE_PATH.value:
+                output_line += full_path + ','
+            elif attribute == FileOptions.FILE_SIZE.value:
+                output_line += str(round(os.path.getsize(full_path)/(1000*1000),3)) + ','
+            else:
+                raise NotImplementedError
+        except (FileNotFoundError, OSError, PermissionError):
+            pass
+    return output_line
+
+
+# Returns the SOPInstanceUID ('' if it's missing) from a header only read, which is much cheaper than a full read
+def get_sop_instance_uid(full_path):
+    sop_instance_uid_tag = 0x00080018
+    ds = pydicom.read_file(full_path, stop_before_pixels=True)
+    return get_dicom_value_from_tag(ds, sop_instance_uid_tag)
+
+
+# Splits sample_size files between strata of the given sizes, returning how many to take from each.
+# Every stratum gets one file, and the rest are shared out in proportion to the files each stratum has left
+# (largest remainder rounding), so the total never goes over sample_size or the number of files available.
+# Assumes there are no more strata than sample_size
+def allocate_sample(strata_sizes, sample_size):
+    allocation = [1] * len(strata_sizes)
+    spare_files = [size - 1 for size in strata_sizes]
+    total_spare_files = sum(spare_files)
+    if total_spare_files == 0:
+        return allocation
+    remaining = min(sample_size, sum(strata_sizes)) - len(strata_sizes)
+    shares = [remaining * spare / total_spare_files for spare in spare_files]
+    for index, share in enumerate(shares):
+        allocation[index] += int(share)
+    leftover = remaining - sum(int(share) for share in shares)
+    by_remainder = sorted(range(len(shares)), key=lambda index: shares[index] - int(shares[index]), reverse=True)
+    for index in by_remainder[0:leftover]:
+        allocation[index] += 1
+    return allocation
+
+
+# Returns the SeriesInstanceUID from a header only read, or None if the file isn't a readable DICOM file
+def get_series_instance_uid(full_path):
+    series_instance_uid_tag = 0x0020000E
+    try:
+        ds = pydicom.read_file(full_path, stop_before_pixels=True)
+    except (pydicom.errors.InvalidDicomError, FileNotFoundError, OSError, PermissionError):
+        return None
+    return get_dicom_value_from_tag(ds, series_instance_uid_tag)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def get_file_hash(full_path, chunk_size=1024*1024):
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
     GUI = MainWindow()
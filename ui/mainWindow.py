@@ -76,6 +76,20 @@ class Ui_MainWindow(object):
         self.line_3.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.line_3.setObjectName("line_3")
         self.verticalLayout.addWidget(self.line_3)
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.label_6 = QtWidgets.QLabel(self.centralwidget)
+        self.label_6.setObjectName("label_6")
+        self.horizontalLayout_3.addWidget(self.label_6)
+        self.comboBoxDuplicateHandling = QtWidgets.QComboBox(self.centralwidget)
+        self.comboBoxDuplicateHandling.setObjectName("comboBoxDuplicateHandling")
+        self.horizontalLayout_3.addWidget(self.comboBoxDuplicateHandling)
+        self.checkBoxHashDuplicates = QtWidgets.QCheckBox(self.centralwidget)
+        self.checkBoxHashDuplicates.setObjectName("checkBoxHashDuplicates")
+        self.horizontalLayout_3.addWidget(self.checkBoxHashDuplicates)
+        spacerItem2 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_3.addItem(spacerItem2)
+        self.verticalLayout.addLayout(self.horizontalLayout_3)
         self.pushButtonDoAnalysis = QtWidgets.QPushButton(self.centralwidget)
         self.pushButtonDoAnalysis.setObjectName("pushButtonDoAnalysis")
         self.verticalLayout.addWidget(self.pushButtonDoAnalysis)
@@ -96,10 +110,14 @@ class Ui_MainWindow(object):
         self.actionSave_Template.setObjectName("actionSave_Template")
         self.actionLoad_Template = QtWidgets.QAction(MainWindow)
         self.actionLoad_Template.setObjectName("actionLoad_Template")
+        self.actionEstimate_Run = QtWidgets.QAction(MainWindow)
+        self.actionEstimate_Run.setObjectName("actionEstimate_Run")
         self.actionAbout = QtWidgets.QAction(MainWindow)
         self.actionAbout.setObjectName("actionAbout")
         self.menuFile.addAction(self.actionSave_Template)
         self.menuFile.addAction(self.actionLoad_Template)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionEstimate_Run)
         self.menuHelp.addSeparator()
         self.menuHelp.addAction(self.actionAbout)
         self.menubar.addAction(self.menuFile.menuAction())
@@ -120,11 +138,14 @@ class Ui_MainWindow(object):
         self.pushButtonBrowseOutputFilePath.setText(_translate("MainWindow", "Browse"))
         self.label_5.setText(_translate("MainWindow", "Attributes"))
         self.pushButtonAddListWidget.setText(_translate("MainWindow", "Add new"))
+        self.label_6.setText(_translate("MainWindow", "Duplicate instances"))
+        self.checkBoxHashDuplicates.setText(_translate("MainWindow", "Confirm duplicates by content hash"))
         self.pushButtonDoAnalysis.setText(_translate("MainWindow", "Go!"))
         self.menuFile.setTitle(_translate("MainWindow", "Fi&le"))
         self.menuHelp.setTitle(_translate("MainWindow", "Help"))
         self.actionSave_Template.setText(_translate("MainWindow", "Save Template"))
         self.actionLoad_Template.setText(_translate("MainWindow", "Load Template"))
+        self.actionEstimate_Run.setText(_translate("MainWindow", "Estimate Run"))
         self.actionAbout.setText(_translate("MainWindow", "About"))
 
 from QDICOMMiner import ClickableQLabel